@@ -5,9 +5,11 @@ repo_token_estimator.py
 Back-of-the-envelope token estimate for a git repo (or any directory).
 
 Default behavior:
-- Uses `git ls-files` (tracked files only)
+- Uses `git ls-files` (tracked files only; sizes of files unchanged since
+  HEAD come from `git ls-tree` instead of stat())
 - Filters to "relevant" text-like extensions
-- Skips likely-binary files by a quick null-byte sniff
+- Skips likely-binary files by a quick null-byte sniff (well-known text and
+  binary extensions are classified without opening the file)
 - Reports totals + per-extension breakdown + largest files
 
 Token estimate:
@@ -19,16 +21,19 @@ from __future__ import annotations
 
 import argparse
 import fnmatch
+import functools
+import heapq
 import os
+import re
 import subprocess
 import sys
-from collections import defaultdict
-from dataclasses import dataclass
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
 from pathlib import Path
-from typing import Iterable, Iterator
+from typing import Iterable, Iterator, NamedTuple
 
 
-DEFAULT_EXTS = [
+DEFAULT_EXTS: frozenset[str] = frozenset({
     # Python
     ".py", ".pyi",
     # JS/TS
@@ -47,9 +52,60 @@ DEFAULT_EXTS = [
     ".sql",
     # Misc
     ".proto", ".graphql",
-]
+})
 
-SKIP_FILENAMES = {
+# Extensions we trust to be text without sniffing the file contents. Generic
+# data extensions (.txt, .json) are left out: UTF-16 files and NUL-laden
+# test fixtures are common enough there that they still get sniffed.
+KNOWN_TEXT_EXTS: frozenset[str] = frozenset({
+    ".py", ".pyi",
+    ".js", ".jsx", ".ts", ".tsx", ".mjs", ".cjs",
+    ".java", ".kt", ".kts", ".scala",
+    ".go", ".rs", ".c", ".cc", ".cpp", ".h", ".hpp",
+    ".sh", ".bash", ".zsh",
+    ".yaml", ".yml", ".toml",
+    ".md", ".rst", ".adoc",
+    ".sql", ".proto", ".graphql",
+})
+
+# Directories never descended into by walk_all_files.
+PRUNE_DIRS: frozenset[str] = frozenset({
+    ".git", ".hg", ".svn",
+    "node_modules", ".venv", "venv",
+    "__pycache__", ".pytest_cache", ".mypy_cache",
+    "dist", "build", "target", ".gradle",
+    ".idea", ".vscode",
+})
+
+# Extensions we treat as binary without sniffing the file contents.
+KNOWN_BINARY_EXTS: frozenset[str] = frozenset({
+    # Images / media
+    ".png", ".jpg", ".jpeg", ".gif", ".bmp", ".ico", ".webp", ".tif", ".tiff",
+    ".mp3", ".mp4", ".m4a", ".wav", ".ogg", ".flac", ".mov", ".avi", ".webm",
+    # Fonts
+    ".ttf", ".otf", ".woff", ".woff2", ".eot",
+    # Archives
+    ".zip", ".gz", ".tgz", ".bz2", ".xz", ".zst", ".7z", ".rar", ".tar",
+    ".jar", ".whl", ".egg",
+    # Compiled / native
+    ".pyc", ".pyo", ".pyd", ".so", ".dylib", ".dll", ".exe", ".o", ".a",
+    ".lib", ".class", ".wasm",
+    # Documents / databases
+    ".pdf", ".doc", ".docx", ".xls", ".xlsx", ".ppt", ".pptx",
+    ".sqlite", ".sqlite3", ".db",
+})
+
+# Threads used to overlap the binary-sniff reads, and how many candidates
+# are handed to them at a time.
+SNIFF_WORKERS = 16
+SNIFF_BATCH = 1024
+
+# os.open flags for the sniff: binary mode on Windows, never block on odd
+# files, and (Linux) don't bump atime just because we peeked at a file.
+_SNIFF_FLAGS = os.O_RDONLY | getattr(os, "O_BINARY", 0) | getattr(os, "O_NONBLOCK", 0)
+_O_NOATIME = getattr(os, "O_NOATIME", 0)
+
+SKIP_FILENAMES: frozenset[str] = frozenset({
     # JS/TS
     "package-lock.json",
     "npm-shrinkwrap.json",
@@ -72,130 +128,372 @@ SKIP_FILENAMES = {
     # Go
     "go.sum",
     "go.work.sum",
-}
+})
 
 
-@dataclass(frozen=True)
-class FileStat:
-    path: Path
+class FileStat(NamedTuple):
+    path: str
     size: int
     ext: str
 
 
-def is_probably_binary(path: Path, sniff_bytes: int = 4096) -> bool:
+def is_probably_binary(path: str, sniff_bytes: int = 512) -> bool:
     """
     Cheap binary sniff: if the file contains a NUL byte in the first N bytes,
     treat it as binary.
 
     This is intentionally simple and fast. It will misclassify some files,
-    but it avoids pulling in external deps.
+    but it avoids pulling in external deps. A NUL in the first sector is
+    already a near-perfect binary indicator, so we read just that much, via
+    a raw fd (no buffered file object for a single small read).
     """
     try:
-        with path.open("rb") as f:
-            chunk = f.read(sniff_bytes)
+        try:
+            fd = os.open(path, _SNIFF_FLAGS | _O_NOATIME)
+        except PermissionError:
+            if not _O_NOATIME:
+                raise
+            # O_NOATIME is only allowed on files we own
+            fd = os.open(path, _SNIFF_FLAGS)
+        try:
+            chunk = os.read(fd, sniff_bytes)
+        finally:
+            os.close(fd)
         return b"\x00" in chunk
-    except (OSError, IOError):
+    except OSError:
         return True  # unreadable -> treat as irrelevant
 
 
-def git_tracked_files(repo_root: Path) -> list[Path]:
+def _start_git(repo_root: Path, *args: str, stdin: bool = False) -> subprocess.Popen[bytes]:
+    """
+    Start `git -C repo_root <args>` with stdout (and optionally stdin) piped;
+    see _finish_git.
+
+    GIT_OPTIONAL_LOCKS=0 stops these read-only commands from taking (or
+    waiting on) the index lock.
+    """
+    return subprocess.Popen(
+        ["git", "-C", str(repo_root), *args],
+        stdin=subprocess.PIPE if stdin else None,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.DEVNULL,
+        bufsize=1 << 20,
+        env={**os.environ, "GIT_OPTIONAL_LOCKS": "0"},
+    )
+
+
+def _finish_git(proc: subprocess.Popen[bytes], stdin_data: bytes | None = None) -> bytes:
     """
-    Return tracked files in repo_root (like `git ls-files`).
+    Drain a git process started by _start_git (in one read through its large
+    pipe buffer), feeding it stdin_data if given, and return its stdout.
+    """
+    out, _ = proc.communicate(stdin_data)  # single read to EOF, then wait
+    if proc.returncode:
+        raise subprocess.CalledProcessError(proc.returncode, proc.args)
+    return out
+
+
+# The git commands behind git_tracked_files_with_sizes: the index (which
+# paths are tracked, their blob ids, and -v status tags), the paths whose
+# working-tree copy differs from the index, and HEAD's tree (which carries
+# blob sizes).
+_GIT_LISTING: tuple[tuple[str, ...], ...] = (
+    ("ls-files", "-z", "-s", "-v"),
+    ("ls-files", "-z", "-m", "-d"),
+    ("ls-tree", "-rlz", "HEAD"),
+    ("config", "--get", "core.autocrlf"),
+)
+
+# Attributes under which checkout may rewrite a blob (eol conversion,
+# smudge filters such as git-lfs, $Id$ expansion, re-encoding), so the file
+# on disk needn't be the size of its blob. "unset" (e.g. -text) is harmless.
+_CONVERSION_ATTRS: tuple[str, ...] = ("text", "eol", "filter", "ident", "working-tree-encoding")
+
+
+# git modes of regular (non-symlink, non-submodule) files.
+_REGULAR_FILE_MODES: frozenset[str] = frozenset({"100644", "100755"})
+
+
+def start_git_listing(repo_root: Path) -> list[subprocess.Popen[bytes]] | None:
+    """
+    Start the git commands used by git_tracked_files_with_sizes in the
+    background, so the caller can overlap its own setup with git's startup.
+    Returns None if git can't be run.
     """
     try:
-        out = subprocess.check_output(
-            ["git", "-C", str(repo_root), "ls-files", "-z"],
-            stderr=subprocess.DEVNULL,
+        return [_start_git(repo_root, *args) for args in _GIT_LISTING]
+    except OSError:
+        return None
+
+
+def _checkout_converted(repo_root: Path, paths: list[str]) -> set[str]:
+    """
+    Return the paths that have any of _CONVERSION_ATTRS set, via a single
+    `git check-attr --stdin`. If that fails, every path is assumed converted.
+    """
+    if not paths:
+        return set()
+    try:
+        out = _finish_git(
+            _start_git(repo_root, "check-attr", "-z", "--stdin", *_CONVERSION_ATTRS, stdin=True),
+            "\0".join(paths).encode("utf-8") + b"\0",
         )
-    except (subprocess.CalledProcessError, FileNotFoundError):
+    except (subprocess.CalledProcessError, OSError):
+        return set(paths)
+    # records: "<path> NUL <attr> NUL <value> NUL"
+    fields = out.decode("utf-8", "ignore").split("\0")
+    return {
+        fields[i]
+        for i in range(0, len(fields) - 2, 3)
+        if fields[i + 2] not in ("unspecified", "unset")
+    }
+
+
+def git_tracked_files_with_sizes(
+    repo_root: Path,
+    listing: list[subprocess.Popen[bytes]] | None = None,
+) -> list[tuple[str, int | None]]:
+    """
+    Return (relpath, size) for tracked files in repo_root (like
+    `git ls-files`), taking sizes from `git ls-tree -rl HEAD` instead of
+    stat'ing every file.
+
+    A blob size is only used when it matches the working tree: the index
+    entry has the same blob id as HEAD and the file isn't modified or
+    deleted, git is tracking its working-tree state (no skip-worktree or
+    assume-unchanged bit, which hide it from `ls-files -m -d`), and checkout
+    doesn't convert it (core.autocrlf, or text/eol/filter/... attributes).
+    Everything else (new in the index, edited, deleted, sparse, converted,
+    no commits yet) gets None so the caller stats it.
+
+    listing: processes from start_git_listing(repo_root), if already started.
+    """
+    if listing is None:
+        listing = start_git_listing(repo_root)
+    if listing is None:
         raise RuntimeError("Not a git repo (or git not found). Use --all to scan directory.")
 
-    parts = out.split(b"\0")
-    paths: list[Path] = []
-    for p in parts:
-        if not p:
+    # finish every process (no zombies) before deciding what failed
+    outs: list[bytes | None] = []
+    for proc in listing:
+        try:
+            outs.append(_finish_git(proc))
+        except subprocess.CalledProcessError:
+            outs.append(None)
+    index_out, changed_out, tree_out, autocrlf_out = outs
+    if index_out is None or changed_out is None:
+        raise RuntimeError("Not a git repo (or git not found). Use --all to scan directory.")
+
+    changed = set(changed_out.decode("utf-8", "ignore").split("\0"))
+
+    # ls-tree records: "<mode> SP <type> SP <oid> SP+ <size> TAB <path>" NUL.
+    # Blob sizes are keyed by oid: identical content has an identical size.
+    # Only regular files count; a symlink's blob is its target path, and
+    # submodules have no blob at all, so those are left to stat().
+    head_sizes: dict[str, int] = {}
+    # core.autocrlf=true rewrites every text file on checkout, so no blob
+    # size can be trusted ("input" only converts on the way in).
+    autocrlf = (autocrlf_out or b"").strip().lower() in (b"true", b"yes", b"on", b"1")
+    if tree_out is not None and not autocrlf:  # None: no commits yet
+        for rec in tree_out.decode("utf-8", "ignore").split("\0"):
+            if not rec:
+                continue
+            meta = rec.partition("\t")[0]
+            mode, otype, oid, size = meta.split()
+            if mode in _REGULAR_FILE_MODES and otype == "blob" and size.isdigit():
+                head_sizes[oid] = int(size)
+
+    # ls-files -s -v records: "<tag> SP <mode> SP <oid> SP <stage> TAB <path>"
+    # NUL. "H" is a plain cached entry; "S" (skip-worktree) and lowercase
+    # (assume-unchanged) entries may not match what's on disk, if present at
+    # all. A conflicted path has one record per stage; report it once, as
+    # ls-files does.
+    files: list[tuple[str, int | None]] = []
+    prev = None
+    for rec in index_out.decode("utf-8", "ignore").split("\0"):
+        if not rec:
+            continue
+        meta, _, rel = rec.partition("\t")
+        if rel == prev:
             continue
-        s = p.decode("utf-8", "ignore")
-        paths.append(repo_root / s)
-    return paths
-
-
-def walk_all_files(root: Path) -> Iterator[Path]:
-    for dirpath, dirnames, filenames in os.walk(root):
-        # skip common junk dirs
-        d = Path(dirpath)
-        # mutate dirnames in-place to prune walk
-        prune = {
-            ".git", ".hg", ".svn",
-            "node_modules", ".venv", "venv",
-            "__pycache__", ".pytest_cache", ".mypy_cache",
-            "dist", "build", "target", ".gradle",
-            ".idea", ".vscode",
-        }
-        dirnames[:] = [dn for dn in dirnames if dn not in prune]
-        for fn in filenames:
-            yield d / fn
+        prev = rel
+        tag, mode, oid = meta.split()[:3]
+        if tag != "H" or rel in changed or mode not in _REGULAR_FILE_MODES:
+            files.append((rel, None))
+        else:
+            files.append((rel, head_sizes.get(oid)))
+
+    # Only the paths that would otherwise get a blob size need the
+    # (comparatively slow) attribute check.
+    converted = _checkout_converted(repo_root, [rel for rel, size in files if size is not None])
+    if converted:
+        files = [(rel, None if rel in converted else size) for rel, size in files]
+    return files
+
+
+def walk_all_files(root: Path, include_hidden: bool = True) -> Iterator[os.DirEntry[str]]:
+    """
+    Yield file entries under root, pruning common junk dirs (and hidden dirs,
+    unless include_hidden) so their subtrees are never scanned.
 
+    Uses os.scandir directly so file-vs-dir checks come from the cached
+    DirEntry data instead of an extra stat() per entry.
+    """
+    stack = [str(root)]
+    while stack:
+        dirpath = stack.pop()
+        subdirs: list[str] = []
+        try:
+            with os.scandir(dirpath) as it:
+                for entry in it:
+                    try:
+                        if entry.is_dir(follow_symlinks=False):
+                            dn = entry.name
+                            if dn not in PRUNE_DIRS and (include_hidden or not dn.startswith(".")):
+                                subdirs.append(entry.path)
+                        elif entry.is_file():
+                            yield entry
+                    except OSError:
+                        continue
+        except OSError:
+            continue
+        # reversed so subdirs are visited in scandir order, like os.walk
+        stack.extend(reversed(subdirs))
 
-def iter_filestats(
-    paths: Iterable[Path],
-    exts: set[str],
+
+@functools.lru_cache(maxsize=256)
+def _compile_globs(globs: tuple[str, ...]) -> re.Pattern[str]:
+    """
+    One regex matching any of globs. Memoized so repeated calls (e.g. when
+    used as a library, once per directory) don't re-translate the patterns.
+    """
+    # fnmatch is case-insensitive where the OS is (i.e. Windows)
+    flags = re.IGNORECASE if os.path.normcase("A") == "a" else 0
+    return re.compile("|".join(f"(?:{fnmatch.translate(pat)})" for pat in globs), flags)
+
+
+def compile_excludes(patterns: list[str]) -> tuple[re.Pattern[str] | None, list[str]]:
+    """
+    Split --exclude patterns into one compiled regex (for the globs) and a
+    list of plain substrings.
+
+    Translating every glob once up front avoids fnmatch re-translating each
+    pattern for every file.
+    """
+    globs = [pat for pat in patterns if any(ch in pat for ch in "*?[]")]
+    substrings = [pat for pat in patterns if pat not in globs]
+    if not globs:
+        return None, substrings
+    return _compile_globs(tuple(globs)), substrings
+
+
+def _iter_candidates(
+    paths: Iterable[os.DirEntry[str] | tuple[str, int | None]],
+    exts: frozenset[str],
     root: Path,
     include_hidden: bool,
-    binary_policy: str,
-    exclude_globs: list[str],
+    exclude_re: re.Pattern[str] | None,
+    exclude_substrings: list[str],
 ) -> Iterator[FileStat]:
     """
-    binary_policy:
-      - "skip"   : skip probable binaries
-      - "include": include all files regardless
+    Apply every filter that doesn't need to open the file.
     """
-    for p in paths:
-        try:
-            rel = p.relative_to(root)
-        except ValueError:
-            rel = p
+    # Everything here is plain str + os.path: pathlib objects are too slow to
+    # build several times per file.
+    root_str = str(root)
+    prefix_len = len(os.path.join(root_str, ""))
+    native_sep = os.sep != "/"
+
+    # Checks are ordered cheapest-first: string tests, then stat().
+    for entry in paths:
+        if isinstance(entry, os.DirEntry):
+            # path, name (and later stat) all come straight off the entry
+            dir_entry = entry
+            path, name, size = entry.path, entry.name, None
+            rel = path[prefix_len:]
+            if native_sep:
+                rel = rel.replace(os.sep, "/")
+        else:
+            dir_entry = None
+            rel, size = entry
+            name = rel.rpartition("/")[2]
+        if name in SKIP_FILENAMES:
+            continue
+
+        # same rule as PurePath.suffix ("weird." and ".bashrc" have none)
+        i = name.rfind(".")
+        ext = name[i:].lower() if 0 < i < len(name) - 1 else ""
+        if exts and ext not in exts:
+            continue
 
         if not include_hidden:
             # skip hidden path segments ('.foo')
-            if any(part.startswith(".") for part in rel.parts):
+            if rel.startswith(".") or "/." in rel:
                 continue
 
-        if p.name in SKIP_FILENAMES:
-            continue
-
-        if exclude_globs:
-            rel_posix = rel.as_posix()
-            name = p.name
-            skip = False
-            for pat in exclude_globs:
-                if any(ch in pat for ch in "*?[]"):
-                    if fnmatch.fnmatch(rel_posix, pat) or fnmatch.fnmatch(name, pat):
-                        skip = True
-                        break
-                else:
-                    # Treat plain strings as substring match on filename or path
-                    if pat in name or pat in rel_posix:
-                        skip = True
-                        break
-            if skip:
+        if exclude_re is not None or exclude_substrings:
+            if exclude_re is not None and (exclude_re.match(rel) or exclude_re.match(name)):
+                continue
+            # Plain strings are a substring match on filename or path
+            if any(pat in name or pat in rel for pat in exclude_substrings):
                 continue
 
-        ext = p.suffix.lower()
-        if exts and ext not in exts:
+        if dir_entry is None:
+            path = os.path.join(root_str, rel)
+        if size is None:
+            try:
+                # DirEntry.stat() is cached (and free on Windows)
+                st = os.stat(path) if dir_entry is None else dir_entry.stat()
+            except OSError:
+                continue  # gone, unreadable, or a parent is no longer a dir
+            size = st.st_size
+        if size <= 0:
             continue
 
-        if binary_policy == "skip" and is_probably_binary(p):
-            continue
+        yield FileStat(path=path, size=size, ext=ext or "<none>")
 
-        try:
-            st = p.stat()
-        except FileNotFoundError:
-            continue
-        if not st or st.st_size <= 0:
-            continue
 
-        yield FileStat(path=p, size=int(st.st_size), ext=ext or "<none>")
+def iter_filestats(
+    paths: Iterable[os.DirEntry[str] | tuple[str, int | None]],
+    exts: frozenset[str],
+    root: Path,
+    include_hidden: bool,
+    binary_policy: str,
+    exclude_re: re.Pattern[str] | None,
+    exclude_substrings: list[str],
+) -> Iterator[FileStat]:
+    """
+    paths: DirEntry objects (from walk_all_files) or (relpath, size) pairs,
+    where relpath is posix and relative to root, and size may be None if it
+    isn't already known.
+
+    binary_policy:
+      - "skip"   : skip probable binaries
+      - "include": include all files regardless
+    """
+    candidates = _iter_candidates(
+        paths, exts, root, include_hidden, exclude_re, exclude_substrings,
+    )
+    if binary_policy != "skip":
+        yield from candidates
+        return
+
+    # Well-known extensions are classified without reading: binary ones are
+    # dropped here, text ones are let through below, and only the rest get
+    # sniffed.
+    candidates = (fs for fs in candidates if fs.ext not in KNOWN_BINARY_EXTS)
+
+    # The sniff is the only step that opens files. It's I/O-bound and read()
+    # releases the GIL, so overlap the opens/reads on a thread pool. Work in
+    # batches so we never hold more than SNIFF_BATCH candidates at once.
+    with ThreadPoolExecutor(max_workers=SNIFF_WORKERS) as pool:
+        while batch := list(islice(candidates, SNIFF_BATCH)):
+            to_sniff = [fs.path for fs in batch if fs.ext not in KNOWN_TEXT_EXTS]
+            binary = pool.map(is_probably_binary, to_sniff)  # in input order
+            for fs in batch:
+                if fs.ext not in KNOWN_TEXT_EXTS and next(binary):
+                    continue
+                yield fs
 
 
 def fmt_int(n: float | int) -> str:
@@ -211,12 +509,16 @@ def estimate_tokens(size_bytes: int) -> tuple[int, int]:
 def print_table(rows: list[list[str]]) -> None:
     if not rows:
         return
-    widths = [max(len(r[i]) for r in rows) for i in range(len(rows[0]))]
-    for idx, r in enumerate(rows):
-        line = "  ".join(r[i].rjust(widths[i]) if i else r[i].ljust(widths[i]) for i in range(len(r)))
-        print(line)
-        if idx == 0:
-            print("  ".join("-" * w for w in widths))
+    widths = [max(map(len, col)) for col in zip(*rows)]
+    w0, wrest = widths[0], widths[1:]
+
+    def fmt(r: list[str]) -> str:
+        # first column left-aligned, the rest right-aligned
+        return "  ".join([r[0].ljust(w0), *map(str.rjust, r[1:], wrest)])
+
+    lines = [fmt(rows[0]), "  ".join("-" * w for w in widths)]
+    lines.extend(map(fmt, rows[1:]))
+    sys.stdout.write("\n".join(lines) + "\n")
 
 
 def main(argv: list[str]) -> int:
@@ -239,35 +541,59 @@ def main(argv: list[str]) -> int:
 
     root = Path(args.path).resolve()
 
+    # Kick off git first; the rest of the setup runs while it starts up.
+    git_listing = None if args.all else start_git_listing(root)
+
+    exts: frozenset[str]
     if args.no_ext_filter:
-        exts: set[str] = set()
+        exts = frozenset()
     elif args.ext:
-        exts = {e.lower() if e.startswith(".") else "." + e.lower() for e in args.ext}
+        exts = frozenset(e.lower() if e.startswith(".") else "." + e.lower() for e in args.ext)
     else:
-        exts = set(DEFAULT_EXTS)
+        exts = DEFAULT_EXTS
+
+    exclude_re, exclude_substrings = compile_excludes(args.exclude)
 
     # Collect candidate paths
+    paths: Iterable[os.DirEntry[str]] | list[tuple[str, int | None]]
     if args.all:
-        paths = list(walk_all_files(root))
+        paths = walk_all_files(root, include_hidden=args.include_hidden)
     else:
         try:
-            paths = git_tracked_files(root)
+            paths = git_tracked_files_with_sizes(root, git_listing)
         except RuntimeError as e:
             print(f"warning: {e}", file=sys.stderr)
             print("falling back to --all scan.", file=sys.stderr)
-            paths = list(walk_all_files(root))
+            paths = walk_all_files(root, include_hidden=args.include_hidden)
 
-    stats = list(iter_filestats(
+    stats = iter_filestats(
         paths=paths,
         exts=exts,
         root=root,
         include_hidden=args.include_hidden,
         binary_policy=args.binary,
-        exclude_globs=args.exclude,
-    ))
-
-    total_bytes = sum(s.size for s in stats)
-    total_files = len(stats)
+        exclude_re=exclude_re,
+        exclude_substrings=exclude_substrings,
+    )
+
+    # Stream the stats through every aggregate at once rather than holding
+    # them all: per-extension [files, bytes] (totals are reduced from these)
+    # and a min-heap of the largest files. Heap entries are (size, -seq, stat)
+    # so equal sizes keep first-seen order, like a stable sort would.
+    top_n = max(args.top, 0)
+    agg: dict[str, list[int]] = {}
+    top: list[tuple[int, int, FileStat]] = []
+    for seq, s in enumerate(stats):
+        a = agg.setdefault(s.ext, [0, 0])
+        a[0] += 1
+        a[1] += s.size
+        if len(top) < top_n:
+            heapq.heappush(top, (s.size, -seq, s))
+        elif top and s.size > top[0][0]:
+            heapq.heapreplace(top, (s.size, -seq, s))
+
+    total_files = sum(n for n, _ in agg.values())
+    total_bytes = sum(b for _, b in agg.values())
     t_low, t_high = estimate_tokens(total_bytes)
 
     print(f"Root: {root}")
@@ -275,29 +601,24 @@ def main(argv: list[str]) -> int:
     print(f"Bytes counted: {fmt_int(total_bytes)}")
     print()
 
-    # Per-extension breakdown
-    by_ext: dict[str, list[FileStat]] = defaultdict(list)
-    for s in stats:
-        by_ext[s.ext].append(s)
-
     rows: list[list[str]] = [["ext", "files", "bytes", "tok_low", "tok_high"]]
-    for ext in sorted(by_ext.keys(), key=lambda k: sum(x.size for x in by_ext[k]), reverse=True):
-        b = sum(x.size for x in by_ext[ext])
+    for ext, (n, b) in sorted(agg.items(), key=lambda kv: kv[1][1], reverse=True):
         lo, hi = estimate_tokens(b)
-        rows.append([ext, fmt_int(len(by_ext[ext])), fmt_int(b), fmt_int(lo), fmt_int(hi)])
+        rows.append([ext, fmt_int(n), fmt_int(b), fmt_int(lo), fmt_int(hi)])
 
     print("By extension:")
     print_table(rows)
     print()
 
     # Largest files
-    topn = sorted(stats, key=lambda s: s.size, reverse=True)[: max(args.top, 0)]
+    topn = [s for _, _, s in sorted(top, reverse=True)]
     if topn:
         print(f"Top {len(topn)} largest files:")
         rows2 = [["bytes", "tok_low", "tok_high", "path"]]
         for s in topn:
             lo, hi = estimate_tokens(s.size)
-            rel = s.path.relative_to(root) if s.path.is_relative_to(root) else s.path
+            p = Path(s.path)
+            rel = p.relative_to(root) if p.is_relative_to(root) else p
             rows2.append([fmt_int(s.size), fmt_int(lo), fmt_int(hi), str(rel)])
         print_table(rows2)
 